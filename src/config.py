@@ -1,3 +1,6 @@
+from dataclasses import dataclass
+from functools import cached_property
+
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 
@@ -11,6 +14,7 @@ class Settings(BaseSettings):
     app_version: str = "1.0.0"
     environment: str = "development"
     log_level: str = "INFO"
+    metrics_enabled: bool = True
 
     # Redis
     redis_host: str = "localhost"
@@ -18,21 +22,50 @@ class Settings(BaseSettings):
     redis_db: int = 0
     redis_password: str = ""
     redis_max_connections: int = 50
+    redis_pool_timeout: int = 5
+    redis_health_check_interval: int = 30
+    redis_key_prefix: str = ""
 
     # URL Configuration
     base_url: str = "http://localhost:8000"
     short_code_length: int = 7
     url_ttl_seconds: int = 2592000  # 30 days
+    url_cache_size: int = 50000
+    url_cache_ttl: int = 60
 
     # Rate Limiting
     rate_limit_requests: int = 100
     rate_limit_window: int = 60
 
-    @property
+    @cached_property
     def redis_url(self) -> str:
         """Construct Redis URL from components."""
         auth = f":{self.redis_password}@" if self.redis_password else ""
         return f"redis://{auth}{self.redis_host}:{self.redis_port}/{self.redis_db}"
 
 
+@dataclass(frozen=True, slots=True)
+class RuntimeSettings:
+    """Immutable snapshot of the settings read on the request path."""
+
+    app_version: str
+    metrics_enabled: bool
+    base_url: str
+    short_code_length: int
+    url_ttl_seconds: int
+    rate_limit_requests: int
+    rate_limit_window: int
+
+
 settings = Settings()
+
+# Plain slot reads for hot paths; pydantic is only used to load the environment
+runtime = RuntimeSettings(
+    app_version=settings.app_version,
+    metrics_enabled=settings.metrics_enabled,
+    base_url=settings.base_url,
+    short_code_length=settings.short_code_length,
+    url_ttl_seconds=settings.url_ttl_seconds,
+    rate_limit_requests=settings.rate_limit_requests,
+    rate_limit_window=settings.rate_limit_window,
+)
@@ -1,20 +1,22 @@
 import logging
+import re
 import time
 from contextlib import asynccontextmanager
-from datetime import datetime, timezone, timedelta
 
 from fastapi import FastAPI, HTTPException, status, Request
-from fastapi.responses import RedirectResponse, JSONResponse
+from fastapi.responses import ORJSONResponse, Response
 
-from src.config import settings
-from src.models import URLCreate, URLResponse, URLStats, HealthResponse
+from src.config import runtime, settings
+from src.models import URLCreate, URLBulkCreate, URLResponse, URLStats, HealthResponse
 from src.shortener import shortener
 from src.storage import storage
-from src.middleware import RateLimitMiddleware
+from src.timeutils import format_iso
+from src.middleware import RateLimitMiddleware, charge_rate_limit
 from src.observability import (
     setup_logging,
     setup_telemetry,
     metrics_endpoint,
+    flush_metrics,
     url_created_counter,
     url_redirected_counter,
     url_not_found_counter,
@@ -27,6 +29,17 @@ logger = logging.getLogger(__name__)
 # Application startup time
 START_TIME = time.time()
 
+# Used to build every create response
+_BASE_URL = runtime.base_url
+_URL_TTL = runtime.url_ttl_seconds
+
+# Short code format check, same rules as custom codes
+_VALID_SHORT_CODE = re.compile(r"[A-Za-z0-9_-]{4,20}").fullmatch
+
+# Pre-encoded error bodies for the redirect path, returned without raising
+_INVALID_CODE_BODY = b'{"detail":"Invalid short code"}'
+_NOT_FOUND_BODY = b'{"detail":"URL not found"}'
+
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
@@ -35,6 +48,8 @@ async def lifespan(app: FastAPI):
     await storage.connect()
     yield
     logger.info("Shutting down application")
+    # Events counted since the last batch would otherwise die with the worker
+    await flush_metrics()
     await storage.disconnect()
 
 
@@ -43,6 +58,7 @@ app = FastAPI(
     title=settings.app_name,
     version=settings.app_version,
     lifespan=lifespan,
+    default_response_class=ORJSONResponse,
     docs_url="/docs" if settings.environment != "production" else None,
     redoc_url="/redoc" if settings.environment != "production" else None,
 )
@@ -62,7 +78,7 @@ async def health_check():
 
     return HealthResponse(
         status="healthy" if redis_status == "healthy" else "degraded",
-        version=settings.app_version,
+        version=runtime.app_version,
         redis=redis_status,
         uptime=uptime,
     )
@@ -71,7 +87,7 @@ async def health_check():
 @app.get("/metrics", tags=["Observability"])
 async def metrics():
     """Prometheus metrics endpoint."""
-    if not settings.metrics_enabled:
+    if not runtime.metrics_enabled:
         raise HTTPException(status_code=404, detail="Metrics disabled")
     return await metrics_endpoint()
 
@@ -86,21 +102,19 @@ async def create_short_url(request: URLCreate):
     - **ttl**: Time-to-live in seconds (optional, max 1 year, default 30 days)
     """
     try:
-        short_code, created_at = await shortener.create_short_url(
+        short_code, created_at, created_epoch = await shortener.create_short_url(
             url=str(request.url), custom_code=request.custom_code, ttl=request.ttl
         )
 
-        url_created_counter["count"] += 1
+        url_created_counter.inc()
 
         # Calculate expiration
-        ttl = request.ttl or settings.url_ttl_seconds
-        expires_at = (
-            datetime.fromisoformat(created_at) + timedelta(seconds=ttl)
-        ).isoformat()
+        ttl = request.ttl or _URL_TTL
+        expires_at = format_iso(created_epoch + ttl)
 
         return URLResponse(
             short_code=short_code,
-            short_url=f"{settings.base_url}/{short_code}",
+            short_url=f"{_BASE_URL}/{short_code}",
             original_url=str(request.url),
             created_at=created_at,
             expires_at=expires_at,
@@ -115,6 +129,55 @@ async def create_short_url(request: URLCreate):
         )
 
 
+@app.post(
+    "/api/v1/shorten/bulk",
+    response_model=list[URLResponse],
+    status_code=status.HTTP_201_CREATED,
+    tags=["URL"],
+)
+async def create_short_urls(request: URLBulkCreate, http_request: Request):
+    """
+    Create shortened URLs in bulk.
+
+    Every URL counts against the rate limit, so a batch can be at most the limit.
+
+    - **urls**: Original URLs to shorten (required, 1-500, capped at RATE_LIMIT_REQUESTS)
+    - **ttl**: Time-to-live in seconds for every URL (optional, max 1 year, default 30 days)
+    """
+    # The middleware charged the request itself, charge the remaining URLs here
+    if len(request.urls) > 1:
+        retry_after = await charge_rate_limit(http_request.scope, len(request.urls) - 1)
+        if retry_after is not None:
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Rate limit exceeded. Please try again later.",
+                headers={"Retry-After": str(retry_after)},
+            )
+
+    try:
+        created = await shortener.create_short_urls(urls=request.urls, ttl=request.ttl)
+    except Exception as e:
+        logger.error(f"Failed to create short URLs: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to create short URLs",
+        )
+
+    url_created_counter.inc(len(created))
+
+    ttl = request.ttl or _URL_TTL
+    return [
+        URLResponse(
+            short_code=short_code,
+            short_url=f"{_BASE_URL}/{short_code}",
+            original_url=url,
+            created_at=created_at,
+            expires_at=format_iso(created_epoch + ttl),
+        )
+        for url, (short_code, created_at, created_epoch) in zip(request.urls, created)
+    ]
+
+
 @app.get("/{short_code}", tags=["URL"])
 async def redirect_to_url(short_code: str):
     """
@@ -122,17 +185,26 @@ async def redirect_to_url(short_code: str):
 
     This endpoint increments the click counter and redirects to the original URL.
     """
-    if len(short_code) < 4 or len(short_code) > 20:
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid short code")
+    if not _VALID_SHORT_CODE(short_code):
+        return Response(
+            content=_INVALID_CODE_BODY,
+            status_code=status.HTTP_400_BAD_REQUEST,
+            media_type="application/json",
+        )
 
     url = await shortener.get_original_url(short_code)
 
     if not url:
-        url_not_found_counter["count"] += 1
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="URL not found")
+        url_not_found_counter.inc()
+        return Response(
+            content=_NOT_FOUND_BODY,
+            status_code=status.HTTP_404_NOT_FOUND,
+            media_type="application/json",
+        )
 
-    url_redirected_counter["count"] += 1
-    return RedirectResponse(url=url, status_code=status.HTTP_301_MOVED_PERMANENTLY)
+    url_redirected_counter.inc()
+    # Stored URLs are already normalized by URLCreate, so skip RedirectResponse's re-quoting
+    return Response(status_code=status.HTTP_301_MOVED_PERMANENTLY, headers={"location": url})
 
 
 @app.get("/api/v1/stats/{short_code}", response_model=URLStats, tags=["URL"])
@@ -169,7 +241,7 @@ async def delete_url(short_code: str):
 async def global_exception_handler(request: Request, exc: Exception):
     """Global exception handler for unhandled errors."""
     logger.error(f"Unhandled exception: {exc}", exc_info=True)
-    return JSONResponse(
+    return ORJSONResponse(
         status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
         content={"detail": "Internal server error"},
     )
@@ -1,74 +1,116 @@
 import logging
 import time
-from collections import defaultdict
-from datetime import datetime, timedelta
+from collections import defaultdict, deque
+from functools import partial
 
-from fastapi import Request, HTTPException, status
-from starlette.middleware.base import BaseHTTPMiddleware
+from fastapi import status
+from fastapi.responses import Response
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
 
-from src.config import settings
+from src.config import runtime
+from src.storage import storage
 
 logger = logging.getLogger(__name__)
 
-
-class RateLimitMiddleware(BaseHTTPMiddleware):
-    """Token bucket rate limiting middleware."""
-
-    def __init__(self, app):
-        super().__init__(app)
-        self.requests = defaultdict(list)
-        self.cleanup_interval = 300  # Cleanup every 5 minutes
-        self.last_cleanup = time.time()
-
-    async def dispatch(self, request: Request, call_next):
-        # Skip rate limiting for health checks
-        if request.url.path in ["/health", "/metrics"]:
-            return await call_next(request)
-
-        client_ip = request.client.host
-        now = datetime.now()
-
-        # Periodic cleanup of old entries
-        if time.time() - self.last_cleanup > self.cleanup_interval:
-            self._cleanup_old_entries()
-
-        # Get request timestamps for this client
-        timestamps = self.requests[client_ip]
-
-        # Remove timestamps outside the window
-        cutoff = now - timedelta(seconds=settings.rate_limit_window)
-        timestamps[:] = [ts for ts in timestamps if ts > cutoff]
+# Limits checked on every request, bound once at import
+_RL_LIMIT = runtime.rate_limit_requests
+_RL_WINDOW = runtime.rate_limit_window
+_LIMIT_HEADER = str(_RL_LIMIT)
+_SKIP_PATHS = frozenset({"/health", "/metrics"})
+_CLEANUP_INTERVAL = 300  # Reap idle clients every 5 minutes
+_RATE_LIMITED_BODY = b'{"detail":"Rate limit exceeded. Please try again later."}'
+
+
+def client_ip(scope: Scope) -> str:
+    """Identify the client a request is rate limited as."""
+    client = scope.get("client")
+    return client[0] if client else "unknown"
+
+
+async def charge_rate_limit(scope: Scope, cost: int) -> int | None:
+    """
+    Charge extra requests to the client's window, for routes doing many units of work.
+
+    Returns None if they fit, otherwise the seconds to wait before retrying. The
+    quota left afterwards is what the response's rate limit headers report.
+    """
+    allowed, remaining, reset = await storage.check_rate_limit(client_ip(scope), _RL_LIMIT, _RL_WINDOW, cost)
+    if not allowed:
+        return max(reset - int(time.time()), 1)
+    scope.setdefault("state", {})["rate_limit"] = (remaining, reset)
+    return None
+
+
+class RateLimitMiddleware:
+    """Sliding window rate limiting ASGI middleware backed by Redis."""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+        # Monotonic times of requests Redis allowed from each client in this
+        # worker, bounded to the limit. A client that has used its whole limit
+        # here is rejected without a Redis round trip.
+        self.recent = defaultdict(partial(deque, maxlen=_RL_LIMIT))
+        self.last_cleanup = time.monotonic()
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        # Skip rate limiting for health checks and non-HTTP traffic
+        if scope["type"] != "http" or scope["path"] in _SKIP_PATHS:
+            await self.app(scope, receive, send)
+            return
+
+        ip = client_ip(scope)
+        now = time.monotonic()
+
+        # Periodic cleanup of idle clients
+        if now - self.last_cleanup > _CLEANUP_INTERVAL:
+            self._cleanup_idle_clients(now)
+
+        # Drop local entries that left the window
+        recent = self.recent[ip]
+        cutoff = now - _RL_WINDOW
+        while recent and recent[0] <= cutoff:
+            recent.popleft()
+
+        if len(recent) >= _RL_LIMIT:
+            # Limit already used up in this worker alone
+            allowed, reset = False, int(time.time() + recent[0] + _RL_WINDOW - now)
+        else:
+            # Window is shared by all workers and expires on its own in Redis
+            allowed, remaining, reset = await storage.check_rate_limit(ip, _RL_LIMIT, _RL_WINDOW)
 
         # Check rate limit
-        if len(timestamps) >= settings.rate_limit_requests:
-            logger.warning(f"Rate limit exceeded for {client_ip}")
-            raise HTTPException(
+        if not allowed:
+            logger.warning(f"Rate limit exceeded for {ip}")
+            # Sits outside FastAPI's exception handlers, so respond directly
+            response = Response(
+                content=_RATE_LIMITED_BODY,
                 status_code=status.HTTP_429_TOO_MANY_REQUESTS,
-                detail="Rate limit exceeded. Please try again later.",
-                headers={"Retry-After": str(settings.rate_limit_window)},
+                headers={"Retry-After": str(max(reset - int(time.time()), 1))},
+                media_type="application/json",
             )
-
-        # Add current request
-        timestamps.append(now)
-
-        response = await call_next(request)
-        response.headers["X-RateLimit-Limit"] = str(settings.rate_limit_requests)
-        response.headers["X-RateLimit-Remaining"] = str(
-            settings.rate_limit_requests - len(timestamps)
-        )
-        response.headers["X-RateLimit-Reset"] = str(
-            int((now + timedelta(seconds=settings.rate_limit_window)).timestamp())
-        )
-
-        return response
-
-    def _cleanup_old_entries(self):
-        """Remove entries for IPs with no recent requests."""
-        cutoff = datetime.now() - timedelta(seconds=settings.rate_limit_window * 2)
-        to_remove = [
-            ip for ip, timestamps in self.requests.items() if not timestamps or timestamps[-1] < cutoff
-        ]
+            await response(scope, receive, send)
+            return
+
+        recent.append(now)
+
+        async def send_with_headers(message: Message):
+            if message["type"] == "http.response.start":
+                # Routes that charged extra work report the quota left after it
+                left, resets = scope.get("state", {}).get("rate_limit", (remaining, reset))
+                headers = MutableHeaders(scope=message)
+                headers["X-RateLimit-Limit"] = _LIMIT_HEADER
+                headers["X-RateLimit-Remaining"] = str(left)
+                headers["X-RateLimit-Reset"] = str(resets)
+            await send(message)
+
+        await self.app(scope, receive, send_with_headers)
+
+    def _cleanup_idle_clients(self, now: float):
+        """Remove local entries for clients with no requests in the window."""
+        cutoff = now - _RL_WINDOW
+        to_remove = [ip for ip, recent in self.recent.items() if not recent or recent[-1] <= cutoff]
         for ip in to_remove:
-            del self.requests[ip]
-        self.last_cleanup = time.time()
+            del self.recent[ip]
+        self.last_cleanup = now
         logger.debug(f"Cleaned up {len(to_remove)} rate limit entries")
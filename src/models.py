@@ -1,5 +1,18 @@
 from pydantic import BaseModel, HttpUrl, Field, field_validator
 
+from src.config import runtime
+
+# Every URL in a batch counts against the rate limit, so no batch may exceed it
+MAX_BULK_URLS = min(500, runtime.rate_limit_requests)
+
+
+def _check_url_length(url: HttpUrl) -> str:
+    """Convert HttpUrl to string and validate its length."""
+    url_str = str(url)
+    if len(url_str) > 2048:
+        raise ValueError("URL too long (max 2048 characters)")
+    return url_str
+
 
 class URLCreate(BaseModel):
     """Request model for creating shortened URL."""
@@ -12,10 +25,22 @@ class URLCreate(BaseModel):
     @classmethod
     def validate_url(cls, v: HttpUrl) -> str:
         """Convert HttpUrl to string and validate."""
-        url_str = str(v)
-        if len(url_str) > 2048:
-            raise ValueError("URL too long (max 2048 characters)")
-        return url_str
+        return _check_url_length(v)
+
+
+class URLBulkCreate(BaseModel):
+    """Request model for creating shortened URLs in bulk."""
+
+    urls: list[HttpUrl] = Field(
+        ..., min_length=1, max_length=MAX_BULK_URLS, description="Original URLs to shorten"
+    )
+    ttl: int | None = Field(None, gt=0, le=31536000, description="TTL in seconds (max 1 year)")
+
+    @field_validator("urls")
+    @classmethod
+    def validate_urls(cls, v: list[HttpUrl]) -> list[str]:
+        """Convert each HttpUrl to string and validate."""
+        return [_check_url_length(url) for url in v]
 
 
 class URLResponse(BaseModel):
@@ -2,13 +2,55 @@ import logging
 import time
 
 from src.config import settings
+from src.storage import storage
 
 logger = logging.getLogger(__name__)
 
-# Simple in-memory counters (for basic metrics)
-url_created_counter = {"count": 0}
-url_redirected_counter = {"count": 0}
-url_not_found_counter = {"count": 0}
+# Events are counted per worker and flushed to Redis in batches of this size
+METRICS_FLUSH_EVERY = 100
+
+
+class Counter:
+    """Event counter whose totals are shared by all workers through Redis."""
+
+    __slots__ = ("name", "pending")
+
+    def __init__(self, name: str):
+        self.name = name
+        self.pending = 0
+
+    def inc(self, amount: int = 1):
+        """Count events, flushing to Redis every METRICS_FLUSH_EVERY events."""
+        self.pending += amount
+        if self.pending >= METRICS_FLUSH_EVERY:
+            count, self.pending = self.pending, 0
+            storage.run_in_background(self._push(count))
+
+    async def flush(self):
+        """Push all pending events to Redis."""
+        count, self.pending = self.pending, 0
+        if count:
+            await self._push(count)
+
+    async def _push(self, count: int):
+        # Keep the events locally if Redis is unavailable
+        if not await storage.increment_metric(self.name, count):
+            self.pending += count
+
+
+# Metrics counters
+url_created_counter = Counter("url_created_total")
+url_redirected_counter = Counter("url_redirected_total")
+url_not_found_counter = Counter("url_not_found_total")
+COUNTERS = (url_created_counter, url_redirected_counter, url_not_found_counter)
+
+
+async def flush_metrics():
+    """Push every counter's pending events to Redis, including batches in flight."""
+    # In-flight pushes put their events back on failure, so let them land first
+    await storage.wait_for_background_tasks()
+    for counter in COUNTERS:
+        await counter.flush()
 
 
 def setup_logging():
@@ -26,11 +68,12 @@ def setup_telemetry(app):
 
 
 async def metrics_endpoint():
-    """Simple metrics endpoint."""
-    metrics = f"""# URL Shortener Metrics
-url_created_total {url_created_counter['count']}
-url_redirected_total {url_redirected_counter['count']}
-url_not_found_total {url_not_found_counter['count']}
-"""
+    """Simple metrics endpoint, totals across all workers."""
+    await flush_metrics()
+    totals = await storage.get_metrics()
+
+    metrics = "# URL Shortener Metrics\n" + "".join(
+        f"{counter.name} {totals.get(counter.name, 0) + counter.pending}\n" for counter in COUNTERS
+    )
     from fastapi import Response
     return Response(content=metrics, media_type="text/plain")
@@ -1,16 +1,41 @@
 import hashlib
 import logging
-from datetime import datetime, timezone
+import struct
+import time
 
-from hashids import Hashids
-
-from src.config import settings
+from src.config import runtime
 from src.storage import storage
+from src.timeutils import format_iso
 
 logger = logging.getLogger(__name__)
 
-# Initialize Hashids for generating short codes
-hashids = Hashids(min_length=settings.short_code_length, alphabet="abcdefghijklmnopqrstuvwxyz0123456789")
+# Base32 alphabet for short codes: each character encodes 5 bits of the digest
+_ALPHABET = "abcdefghijklmnopqrstuvwxyz234567"
+_CODE_LENGTH = runtime.short_code_length
+# Every two-character combination, so one lookup encodes 10 bits at once
+_PAIRS = [a + b for a in _ALPHABET for b in _ALPHABET]
+_PAIR_COUNT = (_CODE_LENGTH + 1) // 2
+_PAIR_SHIFTS = tuple(range(10 * (_PAIR_COUNT - 1), -1, -10))
+_DIGEST_SIZE = (_PAIR_COUNT * 10 + 7) // 8
+# Initialized once and copied per code, cheaper than constructing a new hasher
+_HASHER = hashlib.blake2b(digest_size=_DIGEST_SIZE)
+# Timestamps are hashed as 8 raw bytes rather than formatted as decimal text
+_PACK_TIMESTAMP = struct.Struct("<Q").pack
+
+
+def _encode_short_code(url_bytes: bytes, timestamp: int, salt: int = 0) -> str:
+    """Generate short code from an already encoded URL, timestamp and optional salt."""
+    # Create hash from URL + timestamp for uniqueness
+    hasher = _HASHER.copy()
+    hasher.update(url_bytes)
+    hasher.update(_PACK_TIMESTAMP(timestamp))
+    if salt:
+        # Tells apart copies of one URL created in the same second
+        hasher.update(_PACK_TIMESTAMP(salt))
+    hash_digest = hasher.digest()
+    # Encode the digest 10 bits at a time
+    hash_int = int.from_bytes(hash_digest, byteorder="big")
+    return "".join([_PAIRS[(hash_int >> shift) & 1023] for shift in _PAIR_SHIFTS])[:_CODE_LENGTH]
 
 
 class URLShortener:
@@ -19,53 +44,84 @@ class URLShortener:
     @staticmethod
     def generate_short_code(url: str, timestamp: int) -> str:
         """Generate deterministic short code from URL and timestamp."""
-        # Create hash from URL + timestamp for uniqueness
-        hash_input = f"{url}{timestamp}".encode()
-        hash_digest = hashlib.sha256(hash_input).digest()
-        # Convert first 8 bytes to integer for Hashids
-        hash_int = int.from_bytes(hash_digest[:8], byteorder="big")
-        return hashids.encode(hash_int)
+        return _encode_short_code(url.encode(), timestamp)
 
     async def create_short_url(
         self, url: str, custom_code: str | None = None, ttl: int | None = None
-    ) -> tuple[str, str]:
+    ) -> tuple[str, str, int]:
         """
         Create shortened URL.
 
         Returns:
-            Tuple of (short_code, created_at timestamp)
+            Tuple of (short_code, created_at timestamp, created_at epoch seconds)
         """
-        ttl = ttl or settings.url_ttl_seconds
-        timestamp = int(datetime.now(timezone.utc).timestamp())
+        ttl = ttl or runtime.url_ttl_seconds
+        timestamp = int(time.time())
+        created_at = format_iso(timestamp)
 
         if custom_code:
-            # Validate custom code availability
-            if await storage.exists(custom_code):
+            # Claim the custom code atomically
+            if not await storage.save_url_if_absent(custom_code, url, ttl, timestamp):
                 raise ValueError(f"Custom code '{custom_code}' already exists")
             short_code = custom_code
         else:
-            # Generate unique short code
-            attempts = 0
-            while attempts < 5:
-                short_code = self.generate_short_code(url, timestamp + attempts)
-                if not await storage.exists(short_code):
-                    break
-                attempts += 1
-            else:
-                raise RuntimeError("Failed to generate unique short code")
-
-        # Save to storage
-        success = await storage.save_url(short_code, url, ttl)
-        if not success:
-            raise RuntimeError("Failed to save URL mapping")
-
-        created_at = datetime.fromtimestamp(timestamp, tz=timezone.utc).isoformat()
-        return short_code, created_at
+            # Generate short code; the first candidate is almost always free
+            url_bytes = url.encode()
+            short_code = _encode_short_code(url_bytes, timestamp)
+            if not await storage.save_url_if_absent(short_code, url, ttl, timestamp):
+                # Collision: check the remaining candidates in one round trip
+                candidates = [_encode_short_code(url_bytes, timestamp + attempt) for attempt in range(1, 5)]
+                for short_code in await storage.unused_codes(candidates):
+                    if await storage.save_url_if_absent(short_code, url, ttl, timestamp):
+                        break
+                else:
+                    raise RuntimeError("Failed to generate unique short code")
+
+        return short_code, created_at, timestamp
+
+    async def create_short_urls(
+        self, urls: list[str], ttl: int | None = None
+    ) -> list[tuple[str, str, int]]:
+        """
+        Create shortened URLs in bulk, pipelining the Redis writes.
+
+        Returns:
+            List of (short_code, created_at timestamp, created_at epoch seconds) per URL
+        """
+        ttl = ttl or runtime.url_ttl_seconds
+        timestamp = int(time.time())
+        created_at = format_iso(timestamp)
+
+        # Salted with the batch position, so a URL repeated in the batch gets distinct codes
+        codes = [_encode_short_code(url.encode(), timestamp, index) for index, url in enumerate(urls)]
+
+        claimed: list[bool] = []
+        results = []
+        try:
+            # Cleans up after itself if it fails part way through the batch
+            claimed = await storage.save_urls_if_absent(list(zip(codes, urls)), ttl, timestamp)
+            for url, short_code, ok in zip(urls, codes, claimed):
+                if ok:
+                    results.append((short_code, created_at, timestamp))
+                else:
+                    # Collisions with existing codes are rare, retry them singly
+                    results.append(await self.create_short_url(url, ttl=ttl))
+        except Exception:
+            # All or nothing: drop the codes this batch already claimed
+            taken = [short_code for short_code, ok in zip(codes, claimed) if ok]
+            taken += [short_code for short_code, _, _ in results]
+            await storage.delete_urls(list(dict.fromkeys(taken)))
+            raise
+        return results
 
     async def get_original_url(self, short_code: str) -> str | None:
         """Retrieve original URL by short code."""
         return await storage.get_url(short_code)
 
+    async def get_original_urls(self, short_codes: list[str]) -> dict[str, str]:
+        """Retrieve original URLs for many short codes, omitting unknown ones."""
+        return await storage.get_many(short_codes)
+
     async def get_stats(self, short_code: str) -> dict | None:
         """Get URL statistics."""
         return await storage.get_stats(short_code)
@@ -1,14 +1,109 @@
+import asyncio
 import logging
-from datetime import datetime, timezone
-from typing import Optional
+import time
+from contextlib import suppress
+from typing import Any, Coroutine, Optional
 
 import redis.asyncio as redis
-from redis.asyncio import ConnectionPool
+from cachetools import TTLCache
+from redis.asyncio import BlockingConnectionPool, ConnectionPool
+from redis.exceptions import NoScriptError
+from redis.utils import HIREDIS_AVAILABLE
 
 from src.config import settings
+from src.timeutils import format_iso
 
 logger = logging.getLogger(__name__)
 
+# Seconds a health check result is reused, so probe bursts cost one PING
+HEALTH_CHECK_TTL = 1.0
+
+# Seconds clicks on cached URLs are buffered before being written in one batch
+CLICK_FLUSH_INTERVAL = 0.05
+# Longest wait between retries while click flushes keep failing
+CLICK_FLUSH_MAX_DELAY = 5.0
+
+# Commands queued per pipeline flush in bulk writes
+BULK_CHUNK_SIZE = 500
+
+# Sliding-window rate limiter over a sorted set of request timestamps (ms).
+# Trims the window, records `cost` requests only if they all fit under the
+# limit and returns {allowed, remaining, reset_ms} where reset_ms is when the
+# next slot frees up.
+RATE_LIMIT_SCRIPT = """
+local now = tonumber(ARGV[1])
+local window = tonumber(ARGV[2])
+local limit = tonumber(ARGV[3])
+local cost = tonumber(ARGV[4])
+redis.call('ZREMRANGEBYSCORE', KEYS[1], 0, now - window)
+local count = redis.call('ZCARD', KEYS[1])
+local allowed = 0
+if count + cost <= limit then
+    for i = 1, cost do
+        redis.call('ZADD', KEYS[1], now, now .. '-' .. count)
+        count = count + 1
+    end
+    allowed = 1
+end
+redis.call('PEXPIRE', KEYS[1], window)
+local reset = now + window
+local oldest = redis.call('ZRANGE', KEYS[1], 0, 0, 'WITHSCORES')
+if oldest[2] then
+    reset = tonumber(oldest[2]) + window
+end
+return {allowed, limit - count, reset}
+"""
+
+# Fetch a URL and count the click in one command. Only existing counters are
+# incremented, so lookups never create counters without a TTL. URLs stored
+# before clicks had their own key still count into their metadata hash.
+GET_URL_SCRIPT = """
+local url = redis.call('GET', KEYS[1])
+if url then
+    if redis.call('EXISTS', KEYS[2]) == 1 then
+        redis.call('INCR', KEYS[2])
+    elseif redis.call('TYPE', KEYS[3])['ok'] == 'hash' then
+        redis.call('HINCRBY', KEYS[3], 'clicks', 1)
+    end
+end
+return url
+"""
+
+# Apply a batch of buffered clicks. KEYS holds clicks/meta key pairs and ARGV
+# the click count per pair; codes deleted or expired in the meantime have no
+# counter and are skipped, and legacy metadata hashes are counted into.
+COUNT_CLICKS_SCRIPT = """
+for i = 1, #ARGV do
+    if redis.call('EXISTS', KEYS[2 * i - 1]) == 1 then
+        redis.call('INCRBY', KEYS[2 * i - 1], ARGV[i])
+    elseif redis.call('TYPE', KEYS[2 * i])['ok'] == 'hash' then
+        redis.call('HINCRBY', KEYS[2 * i], 'clicks', ARGV[i])
+    end
+end
+return #ARGV
+"""
+
+# Claim a short code and write its metadata in one command. Returns 0 without
+# touching anything when the code is taken, 1 once the mapping is stored and
+# the code published on the invalidation channel (ARGV[4]), since it may have
+# expired and been cached elsewhere under its previous URL.
+CREATE_URL_SCRIPT = """
+if not redis.call('SET', KEYS[1], ARGV[1], 'EX', ARGV[3], 'NX') then
+    return 0
+end
+redis.call('SET', KEYS[2], ARGV[2], 'EX', ARGV[3])
+redis.call('SET', KEYS[3], 0, 'EX', ARGV[3])
+redis.call('PUBLISH', ARGV[4], ARGV[5])
+return 1
+"""
+
+SCRIPTS = {
+    "rate_limit": RATE_LIMIT_SCRIPT,
+    "get_url": GET_URL_SCRIPT,
+    "count_clicks": COUNT_CLICKS_SCRIPT,
+    "create_url": CREATE_URL_SCRIPT,
+}
+
 
 class RedisStorage:
     """Redis-based storage for URL mappings with connection pooling."""
@@ -16,92 +111,351 @@ class RedisStorage:
     def __init__(self):
         self.pool: Optional[ConnectionPool] = None
         self.client: Optional[redis.Redis] = None
+        self.script_shas: dict[str, str] = {}
+        # Namespace for every key, so several deployments can share one database
+        self.key_prefix = settings.redis_key_prefix
+        # Hot short codes are served from memory, at most url_cache_ttl stale
+        self.url_cache: TTLCache = TTLCache(maxsize=settings.url_cache_size, ttl=settings.url_cache_ttl)
+        self._background_tasks: set[asyncio.Task] = set()
+        self._last_ping: tuple[float, bool] = (float("-inf"), False)
+        self._invalidation_task: Optional[asyncio.Task] = None
+        # Clicks on cached URLs not yet written to Redis, per short code
+        self._pending_clicks: dict[str, int] = {}
+        self._click_flush_task: Optional[asyncio.Task] = None
+        # Failed flushes in a row, backing off retries while Redis is down
+        self._click_flush_failures = 0
+        self._click_flush_lock = asyncio.Lock()
 
     async def connect(self):
         """Initialize Redis connection pool."""
-        self.pool = ConnectionPool.from_url(
+        # redis-py picks the C hiredis parser on its own when it is installed
+        if not HIREDIS_AVAILABLE:
+            logger.warning("hiredis not installed, falling back to the pure Python Redis parser")
+        # Bounded pool: callers wait for a free connection instead of opening
+        # new ones past the limit, and idle connections are kept alive
+        self.pool = BlockingConnectionPool.from_url(
             settings.redis_url,
             max_connections=settings.redis_max_connections,
+            timeout=settings.redis_pool_timeout,
+            socket_keepalive=True,
+            health_check_interval=settings.redis_health_check_interval,
             decode_responses=True,
         )
         self.client = redis.Redis(connection_pool=self.pool)
+        try:
+            await self.load_scripts()
+        except Exception as e:
+            # Start degraded rather than not at all; scripts load on first use
+            logger.error(f"Failed to load Redis scripts: {e}")
+        self._invalidation_task = asyncio.create_task(self.listen_for_invalidations())
         logger.info("Redis connection pool initialized")
 
     async def disconnect(self):
         """Close Redis connection pool."""
+        if self._invalidation_task:
+            self._invalidation_task.cancel()
+            # Let the listener unsubscribe while its connection can still be released
+            with suppress(asyncio.CancelledError):
+                await self._invalidation_task
+            self._invalidation_task = None
+        await self.flush_clicks()
+        if self._click_flush_task:
+            # Only left scheduled by a failed final flush, nothing more to do
+            self._click_flush_task.cancel()
+        # Writes still in flight would fail once the client is closed
+        await self.wait_for_background_tasks()
         if self.client:
             await self.client.aclose()
         if self.pool:
             await self.pool.aclose()
         logger.info("Redis connection pool closed")
 
+    def _url_key(self, short_code: str) -> str:
+        return f"{self.key_prefix}url:{short_code}"
+
+    def _meta_key(self, short_code: str) -> str:
+        # Creation time as epoch seconds, the only metadata besides clicks
+        return f"{self.key_prefix}meta:{short_code}"
+
+    def _clicks_key(self, short_code: str) -> str:
+        # Plain counter so clicks are a single INCR; it keeps its TTL when incremented
+        return f"{self.key_prefix}clicks:{short_code}"
+
+    def _keys(self, short_code: str) -> list[str]:
+        return [self._url_key(short_code), self._meta_key(short_code), self._clicks_key(short_code)]
+
+    @property
+    def invalidation_channel(self) -> str:
+        return f"{self.key_prefix}url-invalidations"
+
+    async def listen_for_invalidations(self):
+        """Evict URLs changed or deleted by other workers from the local cache."""
+        while True:
+            try:
+                async with self.client.pubsub() as pubsub:
+                    await pubsub.subscribe(self.invalidation_channel)
+                    # Anything published while we were not subscribed is lost
+                    self.url_cache.clear()
+                    async for message in pubsub.listen():
+                        if message["type"] == "message":
+                            self.url_cache.pop(message["data"], None)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"URL cache invalidation listener failed: {e}")
+                await asyncio.sleep(1)
+
+    async def load_scripts(self):
+        """Load Lua scripts into the Redis script cache."""
+        for name, source in SCRIPTS.items():
+            self.script_shas[name] = await self.client.script_load(source)
+
+    async def _evalsha(self, name: str, keys: list[str], args: list) -> Any:
+        """Run a cached Lua script, reloading it if Redis lost its script cache."""
+        sha = self.script_shas.get(name)
+        if sha is not None:
+            try:
+                return await self.client.evalsha(sha, len(keys), *keys, *args)
+            except NoScriptError:
+                pass
+        self.script_shas[name] = await self.client.script_load(SCRIPTS[name])
+        return await self.client.evalsha(self.script_shas[name], len(keys), *keys, *args)
+
+    def run_in_background(self, coro: Coroutine):
+        """Schedule a fire-and-forget Redis write, keeping a reference until done."""
+        task = asyncio.create_task(coro)
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
+
+    async def wait_for_background_tasks(self):
+        """Wait for scheduled background writes to finish."""
+        if self._background_tasks:
+            await asyncio.gather(*self._background_tasks, return_exceptions=True)
+
     async def health_check(self) -> bool:
         """Check Redis connection health."""
+        checked_at, healthy = self._last_ping
+        now = time.monotonic()
+        if now - checked_at < HEALTH_CHECK_TTL:
+            return healthy
+
         try:
             await self.client.ping()
-            return True
+            healthy = True
         except Exception as e:
             logger.error(f"Redis health check failed: {e}")
-            return False
+            healthy = False
+        self._last_ping = (now, healthy)
+        return healthy
 
-    async def save_url(self, short_code: str, url: str, ttl: int) -> bool:
-        """Save URL mapping with TTL."""
+    async def save_url(self, short_code: str, url: str, ttl: int, created_at: int | None = None) -> bool:
+        """Save URL mapping with TTL, created_at being epoch seconds."""
         try:
-            pipe = self.client.pipeline()
-            timestamp = datetime.now(timezone.utc).isoformat()
-
-            # Store URL mapping
-            pipe.setex(f"url:{short_code}", ttl, url)
-            # Store metadata
-            pipe.hset(
-                f"meta:{short_code}",
-                mapping={"created_at": timestamp, "clicks": 0, "url": url},
-            )
-            pipe.expire(f"meta:{short_code}", ttl)
+            timestamp = created_at or int(time.time())
+
+            # Mapping and metadata go out in a single round trip
+            async with self.client.pipeline(transaction=False) as pipe:
+                # Store URL mapping
+                pipe.setex(self._url_key(short_code), ttl, url)
+                # Store metadata
+                pipe.setex(self._meta_key(short_code), ttl, timestamp)
+                pipe.setex(self._clicks_key(short_code), ttl, 0)
+                # Mapping may have changed, drop it from every worker's cache
+                pipe.publish(self.invalidation_channel, short_code)
+                await pipe.execute()
 
-            await pipe.execute()
+            self.url_cache.pop(short_code, None)
             return True
         except Exception as e:
             logger.error(f"Failed to save URL {short_code}: {e}")
             return False
 
+    async def save_url_if_absent(
+        self, short_code: str, url: str, ttl: int, created_at: int | None = None
+    ) -> bool:
+        """
+        Save URL mapping with TTL unless the short code is already taken.
+
+        Returns False on collision; Redis errors propagate to the caller.
+        """
+        # SET NX claims the code atomically, and metadata is only written once
+        # the code is ours, all in one script
+        created = await self._evalsha(
+            "create_url",
+            self._keys(short_code),
+            [url, created_at or int(time.time()), ttl, self.invalidation_channel, short_code],
+        )
+        if not created:
+            return False
+        self.url_cache.pop(short_code, None)
+        return True
+
+    async def save_urls_if_absent(
+        self, mappings: list[tuple[str, str]], ttl: int, created_at: int
+    ) -> list[bool]:
+        """
+        Save many (short_code, url) mappings with TTL, skipping taken short codes.
+
+        Returns one flag per mapping, False on collision. Redis errors propagate
+        after the codes claimed by earlier chunks are deleted again.
+        """
+        claimed: list[bool] = []
+        for start in range(0, len(mappings), BULK_CHUNK_SIZE):
+            chunk = mappings[start : start + BULK_CHUNK_SIZE]
+
+            # Claim every code in the chunk and write its metadata in one round trip
+            try:
+                try:
+                    results = await self._create_urls(chunk, ttl, created_at)
+                except NoScriptError:
+                    # Redis lost its script cache; nothing in the chunk ran
+                    self.script_shas["create_url"] = await self.client.script_load(CREATE_URL_SCRIPT)
+                    results = await self._create_urls(chunk, ttl, created_at)
+            except Exception:
+                # Which codes of the failed chunk were claimed is unknown, so
+                # only the earlier chunks' codes are known to be ours
+                await self.delete_urls([code for (code, _), ok in zip(mappings, claimed) if ok])
+                raise
+
+            for (short_code, _), ok in zip(chunk, results):
+                if ok:
+                    self.url_cache.pop(short_code, None)
+            claimed.extend(results)
+        return claimed
+
+    async def _create_urls(self, chunk: list[tuple[str, str]], ttl: int, created_at: int) -> list[bool]:
+        """Run the create_url script for each mapping in a single pipeline."""
+        sha = self.script_shas.get("create_url")
+        if sha is None:
+            sha = self.script_shas["create_url"] = await self.client.script_load(CREATE_URL_SCRIPT)
+        async with self.client.pipeline(transaction=False) as pipe:
+            for short_code, url in chunk:
+                pipe.evalsha(
+                    sha, 3, *self._keys(short_code), url, created_at, ttl, self.invalidation_channel, short_code
+                )
+            return [bool(ok) for ok in await pipe.execute()]
+
     async def get_url(self, short_code: str) -> Optional[str]:
         """Retrieve original URL and increment click counter."""
+        url = self.url_cache.get(short_code)
+        if url is not None:
+            # Count the click without holding up the redirect
+            self._count_click(short_code)
+            return url
+
         try:
-            pipe = self.client.pipeline()
-            pipe.get(f"url:{short_code}")
-            pipe.hincrby(f"meta:{short_code}", "clicks", 1)
-            results = await pipe.execute()
-            return results[0]
+            url = await self._evalsha(
+                "get_url",
+                [self._url_key(short_code), self._clicks_key(short_code), self._meta_key(short_code)],
+                [],
+            )
         except Exception as e:
             logger.error(f"Failed to get URL {short_code}: {e}")
             return None
 
+        if url is not None:
+            self.url_cache[short_code] = url
+        return url
+
+    async def get_many(self, short_codes: list[str]) -> dict[str, str]:
+        """Retrieve many original URLs in one round trip, counting a click on each found."""
+        urls = {}
+        uncached = []
+        for short_code in short_codes:
+            url = self.url_cache.get(short_code)
+            if url is None:
+                uncached.append(short_code)
+            else:
+                urls[short_code] = url
+
+        if uncached:
+            try:
+                values = await self.client.mget([self._url_key(short_code) for short_code in uncached])
+            except Exception as e:
+                logger.error(f"Failed to get URLs {uncached}: {e}")
+                values = []
+            for short_code, url in zip(uncached, values):
+                if url is not None:
+                    urls[short_code] = url
+                    self.url_cache[short_code] = url
+
+        # Clicks go through the buffer, so the whole batch is counted in one script call
+        for short_code in urls:
+            self._count_click(short_code)
+        return urls
+
+    def _count_click(self, short_code: str):
+        """Buffer a click on a cached URL, scheduling a batched write."""
+        self._pending_clicks[short_code] = self._pending_clicks.get(short_code, 0) + 1
+        self._schedule_click_flush()
+
+    def _schedule_click_flush(self):
+        if self._click_flush_task is None or self._click_flush_task.done():
+            self._click_flush_task = asyncio.create_task(self._flush_clicks_later())
+
+    async def _flush_clicks_later(self):
+        await asyncio.sleep(min(CLICK_FLUSH_INTERVAL * 2**self._click_flush_failures, CLICK_FLUSH_MAX_DELAY))
+        self._click_flush_task = None
+        await self.flush_clicks()
+
+    async def flush_clicks(self):
+        """Write buffered clicks to Redis in a single command."""
+        # Serialized so a caller returns only once earlier batches have landed
+        async with self._click_flush_lock:
+            pending, self._pending_clicks = self._pending_clicks, {}
+            if not pending:
+                return
+
+            keys = []
+            for short_code in pending:
+                keys += [self._clicks_key(short_code), self._meta_key(short_code)]
+            try:
+                await self._evalsha("count_clicks", keys, list(pending.values()))
+            except Exception as e:
+                # Report the outage once, not on every retry
+                if not self._click_flush_failures:
+                    logger.error(f"Failed to flush {len(pending)} click counters: {e}")
+                self._click_flush_failures += 1
+                # Keep the clicks and retry them, even if no more come in
+                for short_code, clicks in pending.items():
+                    self._pending_clicks[short_code] = self._pending_clicks.get(short_code, 0) + clicks
+                self._schedule_click_flush()
+                return
+
+            if self._click_flush_failures:
+                logger.info(f"Click counters flushed again after {self._click_flush_failures} failed attempts")
+                self._click_flush_failures = 0
+
     async def get_stats(self, short_code: str) -> Optional[dict]:
         """Get URL statistics."""
-        try:
-            pipe = self.client.pipeline()
-            pipe.hgetall(f"meta:{short_code}")
-            pipe.ttl(f"url:{short_code}")
-            results = await pipe.execute()
+        # Clicks buffered by this worker show up in its own stats right away
+        await self.flush_clicks()
 
-            meta = results[0]
-            ttl = results[1]
+        try:
+            # A missing URL comes back as None, so the MGET doubles as the existence check
+            pipe = self.client.pipeline(transaction=False)
+            pipe.mget(self._keys(short_code))
+            pipe.ttl(self._url_key(short_code))
+            (url, created_at, clicks), ttl = await pipe.execute()
 
-            if not meta:
+            if url is None:
                 return None
+            if created_at is None:
+                # Stored before the metadata hash was split into plain keys
+                legacy = await self.client.hgetall(self._meta_key(short_code))
+                if not legacy:
+                    return None
+                created_at, clicks = legacy["created_at"], legacy.get("clicks")
+            else:
+                created_at = format_iso(int(created_at))
 
-            expires_at = None
-            if ttl > 0:
-                from datetime import timedelta
-
-                created = datetime.fromisoformat(meta["created_at"])
-                expires_at = (created + timedelta(seconds=ttl)).isoformat()
+            # TTL is the time left, so expiry counts from now, not from creation
+            expires_at = format_iso(time.time() + ttl) if ttl > 0 else None
 
             return {
-                "original_url": meta["url"],
-                "clicks": int(meta.get("clicks", 0)),
-                "created_at": meta["created_at"],
+                "original_url": url,
+                "clicks": int(clicks or 0),
+                "created_at": created_at,
                 "expires_at": expires_at,
             }
         except Exception as e:
@@ -111,27 +465,94 @@ class RedisStorage:
     async def exists(self, short_code: str) -> bool:
         """Check if short code exists."""
         try:
-            return await self.client.exists(f"url:{short_code}") > 0
+            return await self.client.exists(self._url_key(short_code)) > 0
         except Exception as e:
             logger.error(f"Failed to check existence {short_code}: {e}")
             return False
 
+    async def unused_codes(self, short_codes: list[str]) -> list[str]:
+        """Filter short codes down to those not in use, in a single MGET."""
+        try:
+            urls = await self.client.mget([self._url_key(code) for code in short_codes])
+            return [code for code, url in zip(short_codes, urls) if url is None]
+        except Exception as e:
+            logger.error(f"Failed to check existence {short_codes}: {e}")
+            # Let the caller's SET NX decide
+            return short_codes
+
     async def delete_url(self, short_code: str) -> bool:
         """Delete URL mapping."""
         try:
-            # Check if URL exists first
-            if not await self.exists(short_code):
-                return False
-            
-            pipe = self.client.pipeline()
-            pipe.delete(f"url:{short_code}")
-            pipe.delete(f"meta:{short_code}")
-            await pipe.execute()
-            return True
+            pipe = self.client.pipeline(transaction=False)
+            # UNLINK frees memory off Redis' main thread
+            pipe.unlink(self._url_key(short_code))
+            pipe.unlink(self._meta_key(short_code), self._clicks_key(short_code))
+            pipe.publish(self.invalidation_channel, short_code)
+            deleted, _, _ = await pipe.execute()
+            self.url_cache.pop(short_code, None)
+            # UNLINK reports whether the mapping existed, no separate check needed
+            return deleted > 0
         except Exception as e:
             logger.error(f"Failed to delete URL {short_code}: {e}")
             return False
 
+    async def delete_urls(self, short_codes: list[str]) -> int:
+        """Delete many URL mappings in one round trip, returning how many existed."""
+        if not short_codes:
+            return 0
+        try:
+            async with self.client.pipeline(transaction=False) as pipe:
+                for short_code in short_codes:
+                    pipe.unlink(self._url_key(short_code))
+                    pipe.unlink(self._meta_key(short_code), self._clicks_key(short_code))
+                    pipe.publish(self.invalidation_channel, short_code)
+                results = await pipe.execute()
+        except Exception as e:
+            logger.error(f"Failed to delete URLs {short_codes}: {e}")
+            return 0
+        for short_code in short_codes:
+            self.url_cache.pop(short_code, None)
+        return sum(results[::3])
+
+    async def check_rate_limit(
+        self, identifier: str, limit: int, window: int, cost: int = 1
+    ) -> tuple[bool, int, int]:
+        """
+        Record `cost` requests against a sliding rate limit window, all or none.
+
+        Returns:
+            Tuple of (allowed, remaining requests, reset epoch seconds)
+        """
+        now_ms = int(time.time() * 1000)
+        window_ms = window * 1000
+        try:
+            allowed, remaining, reset_ms = await self._evalsha(
+                "rate_limit", [f"{self.key_prefix}rl:{identifier}"], [now_ms, window_ms, limit, cost]
+            )
+            return bool(allowed), int(remaining), int(reset_ms) // 1000
+        except Exception as e:
+            # Fail open: an unavailable Redis should not take the API down with it
+            logger.error(f"Failed to check rate limit {identifier}: {e}")
+            return True, limit, (now_ms + window_ms) // 1000
+
+    async def increment_metric(self, name: str, amount: int) -> bool:
+        """Add to a metric counter shared by all workers."""
+        try:
+            await self.client.hincrby(f"{self.key_prefix}metrics:global", name, amount)
+            return True
+        except Exception as e:
+            logger.error(f"Failed to increment metric {name}: {e}")
+            return False
+
+    async def get_metrics(self) -> dict[str, int]:
+        """Get metric counters shared by all workers."""
+        try:
+            metrics = await self.client.hgetall(f"{self.key_prefix}metrics:global")
+            return {name: int(value) for name, value in metrics.items()}
+        except Exception as e:
+            logger.error(f"Failed to get metrics: {e}")
+            return {}
+
 
 # Global storage instance
 storage = RedisStorage()
@@ -0,0 +1,6 @@
+import time
+
+
+def format_iso(timestamp: float) -> str:
+    """Format an epoch timestamp as a UTC ISO 8601 string, second precision."""
+    return time.strftime("%Y-%m-%dT%H:%M:%S+00:00", time.gmtime(timestamp))
@@ -1,9 +1,13 @@
+from uuid import uuid4
+
 import pytest
 import pytest_asyncio
+import uvloop
 from httpx import AsyncClient, ASGITransport
 from fakeredis import aioredis as fakeredis
 
 from src.main import app
+from src.shortener import shortener
 from src.storage import storage
 from src.config import settings
 
@@ -11,12 +15,16 @@ from src.config import settings
 pytest_plugins = ('pytest_asyncio',)
 
 
+def pytest_asyncio_loop_factories(config, item):
+    """Run async tests on uvloop, as uvicorn does in production."""
+    return {"uvloop": uvloop.new_event_loop}
+
+
 @pytest_asyncio.fixture
 async def redis_client():
     """Provide fake Redis client for testing."""
     fake_redis = await fakeredis.FakeRedis(decode_responses=True)
     yield fake_redis
-    await fake_redis.flushall()
     await fake_redis.aclose()
 
 
@@ -24,16 +32,35 @@ async def redis_client():
 async def test_storage(redis_client):
     """Provide storage instance with fake Redis."""
     storage.client = redis_client
+    storage.key_prefix = f"t:{uuid4().hex}:"
+    storage.url_cache.clear()
+    storage._pending_clicks.clear()
+    # A task from an earlier test's loop would never finish and block new flushes
+    storage._click_flush_task = None
+    storage._click_flush_failures = 0
     yield storage
+    # Remove only this test's keys; UNLINK frees them off the main thread
+    async with redis_client.pipeline(transaction=False) as pipe:
+        async for key in redis_client.scan_iter(match=f"{storage.key_prefix}*", count=500):
+            pipe.unlink(key)
+        await pipe.execute()
 
 
 @pytest_asyncio.fixture
 async def client(test_storage):
     """Provide async HTTP client for testing."""
+    # Rebuild the middleware stack so per-worker rate limit state starts empty
+    app.middleware_stack = None
     async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as ac:
         yield ac
 
 
+@pytest.fixture(scope="session")
+def shortener_instance():
+    """Provide the app's URLShortener; it is stateless, so one serves every test."""
+    return shortener
+
+
 @pytest.fixture
 def sample_url():
     """Provide sample URL for testing."""
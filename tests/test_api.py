@@ -1,6 +1,10 @@
+from datetime import datetime, timedelta
+
 import pytest
 from httpx import AsyncClient
 
+from src import middleware, models, observability
+
 
 class TestHealthEndpoint:
     """Test health check endpoint."""
@@ -16,6 +20,33 @@ class TestHealthEndpoint:
         assert "uptime" in data
 
 
+class TestMetricsEndpoint:
+    """Test metrics endpoint."""
+
+    async def test_metrics(self, client: AsyncClient, sample_url_data):
+        """Test metrics endpoint reports event counters."""
+        await client.post("/api/v1/shorten", json=sample_url_data)
+
+        response = await client.get("/metrics")
+        assert response.status_code == 200
+        counters = dict(line.split() for line in response.text.splitlines()[1:])
+        assert int(counters["url_created_total"]) >= 1
+        assert "url_redirected_total" in counters
+        assert "url_not_found_total" in counters
+
+    async def test_flush_metrics(self, test_storage):
+        """Test that shutdown flushing pushes pending and in-flight events."""
+        counter = observability.url_not_found_counter
+        expected = counter.pending + observability.METRICS_FLUSH_EVERY + 1
+        # One full batch handed to a background push, one event left pending
+        counter.inc(observability.METRICS_FLUSH_EVERY)
+        counter.inc()
+
+        await observability.flush_metrics()
+        assert counter.pending == 0
+        assert (await test_storage.get_metrics())[counter.name] == expected
+
+
 class TestURLShortening:
     """Test URL shortening functionality."""
 
@@ -47,6 +78,8 @@ class TestURLShortening:
         assert response.status_code == 201
         data = response.json()
         assert "expires_at" in data
+        created_at = datetime.fromisoformat(data["created_at"])
+        assert datetime.fromisoformat(data["expires_at"]) - created_at == timedelta(seconds=ttl)
 
     async def test_duplicate_custom_code(self, client: AsyncClient, sample_url):
         """Test that duplicate custom codes are rejected."""
@@ -57,6 +90,26 @@ class TestURLShortening:
         )
         assert response.status_code == 400
 
+    async def test_create_bulk(self, client: AsyncClient, sample_url):
+        """Test creating shortened URLs in bulk."""
+        urls = [sample_url, "https://www.example.org/other"]
+        response = await client.post("/api/v1/shorten/bulk", json={"urls": urls})
+        assert response.status_code == 201
+        data = response.json()
+        assert [item["original_url"] for item in data] == urls
+        assert len({item["short_code"] for item in data}) == len(urls)
+
+    async def test_create_bulk_repeated_url(self, client: AsyncClient, sample_url):
+        """Test bulk creating many copies of one URL."""
+        response = await client.post("/api/v1/shorten/bulk", json={"urls": [sample_url] * 6})
+        assert response.status_code == 201
+        assert len({item["short_code"] for item in response.json()}) == 6
+
+    async def test_create_bulk_empty(self, client: AsyncClient):
+        """Test that an empty bulk request is rejected."""
+        response = await client.post("/api/v1/shorten/bulk", json={"urls": []})
+        assert response.status_code == 422
+
     async def test_invalid_url(self, client: AsyncClient):
         """Test that invalid URLs are rejected."""
         response = await client.post("/api/v1/shorten", json={"url": "not-a-valid-url"})
@@ -100,6 +153,9 @@ class TestURLRedirection:
         response = await client.get("/ab", follow_redirects=False)  # Too short
         assert response.status_code == 400
 
+        response = await client.get("/bad.code", follow_redirects=False)  # Invalid chars
+        assert response.status_code == 400
+
 
 class TestURLStats:
     """Test URL statistics functionality."""
@@ -161,3 +217,43 @@ class TestURLDeletion:
         """Test deleting non-existent URL."""
         response = await client.delete("/api/v1/urls/nonexistent")
         assert response.status_code == 404
+
+
+class TestRateLimiting:
+    """Test rate limiting middleware."""
+
+    async def test_rate_limit_headers(self, client: AsyncClient):
+        """Test that allowed responses carry rate limit headers."""
+        response = await client.get("/api/v1/stats/nonexistent")
+        assert response.headers["X-RateLimit-Limit"] == middleware._LIMIT_HEADER
+        assert "X-RateLimit-Remaining" in response.headers
+        assert "X-RateLimit-Reset" in response.headers
+
+    async def test_rate_limit_exceeded(self, client: AsyncClient, monkeypatch):
+        """Test that requests over the limit are rejected."""
+        monkeypatch.setattr(middleware, "_RL_LIMIT", 1)
+        await client.get("/api/v1/stats/nonexistent")
+
+        response = await client.get("/api/v1/stats/nonexistent")
+        assert response.status_code == 429
+        assert "Retry-After" in response.headers
+        assert response.json()["detail"] == "Rate limit exceeded. Please try again later."
+
+    async def test_bulk_charged_per_url(self, client: AsyncClient, sample_url, monkeypatch):
+        """Test that every URL in a bulk request counts against the rate limit."""
+        monkeypatch.setattr(middleware, "_RL_LIMIT", 5)
+        response = await client.post("/api/v1/shorten/bulk", json={"urls": [sample_url] * 3})
+        assert response.status_code == 201
+        assert response.headers["X-RateLimit-Remaining"] == "2"
+
+        # 3 of 5 used, a batch of 3 no longer fits
+        response = await client.post("/api/v1/shorten/bulk", json={"urls": [sample_url] * 3})
+        assert response.status_code == 429
+        assert "Retry-After" in response.headers
+
+    async def test_bulk_over_limit_rejected(self, client: AsyncClient, sample_url):
+        """Test that a batch larger than the rate limit is rejected outright, not throttled."""
+        urls = [sample_url] * (models.MAX_BULK_URLS + 1)
+        response = await client.post("/api/v1/shorten/bulk", json={"urls": urls})
+        assert response.status_code == 422
+        assert "Retry-After" not in response.headers
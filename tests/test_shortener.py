@@ -1,17 +1,13 @@
+import asyncio
+
 import pytest
 
-from src.shortener import URLShortener
-from src.storage import RedisStorage
+from src import storage as storage_module
 
 
 class TestURLShortener:
     """Test URL shortener core logic."""
 
-    @pytest.fixture
-    async def shortener_instance(self, test_storage):
-        """Provide URLShortener instance."""
-        return URLShortener()
-
     async def test_generate_short_code(self, shortener_instance):
         """Test short code generation."""
         url = "https://example.com"
@@ -38,7 +34,7 @@ class TestURLShortener:
     async def test_create_short_url(self, shortener_instance, test_storage):
         """Test creating a short URL."""
         url = "https://example.com/test"
-        short_code, created_at = await shortener_instance.create_short_url(url)
+        short_code, created_at, _ = await shortener_instance.create_short_url(url)
         assert short_code
         assert created_at
         assert await test_storage.exists(short_code)
@@ -47,7 +43,7 @@ class TestURLShortener:
         """Test creating URL with custom code."""
         url = "https://example.com/test"
         custom_code = "mycustom"
-        short_code, _ = await shortener_instance.create_short_url(url, custom_code=custom_code)
+        short_code, _, _ = await shortener_instance.create_short_url(url, custom_code=custom_code)
         assert short_code == custom_code
 
     async def test_custom_code_collision(self, shortener_instance, test_storage):
@@ -59,14 +55,90 @@ class TestURLShortener:
         with pytest.raises(ValueError, match="already exists"):
             await shortener_instance.create_short_url(url, custom_code=custom_code)
 
+    async def test_concurrent_custom_code_claim(self, shortener_instance, test_storage):
+        """Test that only one of two concurrent requests gets a custom code."""
+        custom_code = "raced123"
+        results = await asyncio.gather(
+            shortener_instance.create_short_url("https://example.com/a", custom_code=custom_code),
+            shortener_instance.create_short_url("https://example.com/b", custom_code=custom_code),
+            return_exceptions=True,
+        )
+        errors = [r for r in results if isinstance(r, ValueError)]
+        assert len(errors) == 1
+
+    async def test_generated_code_collision(self, shortener_instance, test_storage):
+        """Test that repeated URLs get distinct generated codes."""
+        url = "https://example.com/test"
+        code1, _, _ = await shortener_instance.create_short_url(url)
+        code2, _, _ = await shortener_instance.create_short_url(url)
+        assert code1 != code2
+        assert await shortener_instance.get_original_url(code2) == url
+
+    async def test_create_short_urls(self, shortener_instance, test_storage):
+        """Test creating short URLs in bulk."""
+        urls = ["https://example.com/a", "https://example.com/b", "https://example.com/a"]
+        created = await shortener_instance.create_short_urls(urls)
+
+        codes = [short_code for short_code, _, _ in created]
+        assert len(set(codes)) == len(urls)
+        for url, short_code in zip(urls, codes):
+            assert await shortener_instance.get_original_url(short_code) == url
+
+    async def test_create_short_urls_repeated_url(self, shortener_instance, test_storage):
+        """Test that a URL repeated more times than there are retry candidates still succeeds."""
+        urls = ["https://example.com/x"] * 8
+        created = await shortener_instance.create_short_urls(urls)
+        assert len({short_code for short_code, _, _ in created}) == len(urls)
+
+    async def test_create_short_urls_rolls_back(self, shortener_instance, test_storage, monkeypatch):
+        """Test that a failed bulk create leaves no mappings behind."""
+        url = "https://example.com/x"
+        # Pin the clock so both creates derive the same code
+        monkeypatch.setattr("src.shortener.time.time", lambda: 1700000000.0)
+        # Take the first code so the batch has to fall back to a single create
+        blocked, _, _ = await shortener_instance.create_short_url(url)
+
+        async def fail(*args, **kwargs):
+            raise RuntimeError("Failed to generate unique short code")
+
+        monkeypatch.setattr(shortener_instance, "create_short_url", fail)
+        with pytest.raises(RuntimeError):
+            await shortener_instance.create_short_urls([url, "https://example.com/y"])
+
+        keys = [key async for key in test_storage.client.scan_iter(f"{test_storage.key_prefix}url:*")]
+        assert keys == [f"{test_storage.key_prefix}url:{blocked}"]
+
+    async def test_create_short_urls_failed_chunk_rolls_back(
+        self, shortener_instance, test_storage, monkeypatch
+    ):
+        """Test that a bulk create failing on a later chunk removes the earlier chunks."""
+        monkeypatch.setattr(storage_module, "BULK_CHUNK_SIZE", 2)
+        create_urls = test_storage._create_urls
+        calls = 0
+
+        async def fail_second_chunk(*args, **kwargs):
+            nonlocal calls
+            calls += 1
+            if calls == 2:
+                raise ConnectionError("Redis unavailable")
+            return await create_urls(*args, **kwargs)
+
+        monkeypatch.setattr(test_storage, "_create_urls", fail_second_chunk)
+        urls = [f"https://example.com/{i}" for i in range(5)]
+        with pytest.raises(ConnectionError):
+            await shortener_instance.create_short_urls(urls)
+
+        assert calls == 2
+        assert not [key async for key in test_storage.client.scan_iter(f"{test_storage.key_prefix}*")]
+
     async def test_get_original_url(self, shortener_instance, test_storage):
         """Test retrieving original URL."""
         url = "https://example.com/test"
-        short_code, _ = await shortener_instance.create_short_url(url)
+        short_code, _, _ = await shortener_instance.create_short_url(url)
         retrieved_url = await shortener_instance.get_original_url(short_code)
         assert retrieved_url == url
 
-    async def test_get_nonexistent_url(self, shortener_instance):
+    async def test_get_nonexistent_url(self, shortener_instance, test_storage):
         """Test retrieving non-existent URL."""
         url = await shortener_instance.get_original_url("nonexistent")
         assert url is None
@@ -74,7 +146,7 @@ class TestURLShortener:
     async def test_delete_url(self, shortener_instance, test_storage):
         """Test deleting URL."""
         url = "https://example.com/test"
-        short_code, _ = await shortener_instance.create_short_url(url)
+        short_code, _, _ = await shortener_instance.create_short_url(url)
         success = await shortener_instance.delete_url(short_code)
         assert success
         assert not await test_storage.exists(short_code)
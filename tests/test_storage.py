@@ -1,3 +1,6 @@
+import asyncio
+from datetime import datetime
+
 import pytest
 
 
@@ -16,6 +19,29 @@ class TestRedisStorage:
         retrieved_url = await test_storage.get_url(short_code)
         assert retrieved_url == url
 
+    async def test_save_url_if_absent(self, test_storage):
+        """Test that saving only succeeds for unused short codes."""
+        short_code = "absent123"
+        ttl = 3600
+
+        assert await test_storage.save_url_if_absent(short_code, "https://example.com", ttl)
+        assert not await test_storage.save_url_if_absent(short_code, "https://other.com", ttl)
+
+        assert await test_storage.get_url(short_code) == "https://example.com"
+
+    async def test_save_urls_if_absent_after_script_flush(self, test_storage):
+        """Test that bulk saves reload the create script if Redis lost it."""
+        ttl = 3600
+        assert await test_storage.save_urls_if_absent([("bulk0001", "https://a.com")], ttl, 1700000000) == [True]
+
+        await test_storage.client.script_flush()
+        mappings = [("bulk0001", "https://b.com"), ("bulk0002", "https://c.com")]
+        assert await test_storage.save_urls_if_absent(mappings, ttl, 1700000000) == [False, True]
+
+        stats = await test_storage.get_stats("bulk0002")
+        assert stats["original_url"] == "https://c.com"
+        assert stats["clicks"] == 0
+
     async def test_url_exists(self, test_storage):
         """Test checking URL existence."""
         short_code = "exists123"
@@ -27,6 +53,13 @@ class TestRedisStorage:
         await test_storage.save_url(short_code, url, ttl)
         assert await test_storage.exists(short_code)
 
+    async def test_unused_codes(self, test_storage):
+        """Test filtering out short codes already in use."""
+        await test_storage.save_url("used123", "https://example.com", 3600)
+
+        unused = await test_storage.unused_codes(["free123", "used123", "free456"])
+        assert unused == ["free123", "free456"]
+
     async def test_get_stats(self, test_storage):
         """Test retrieving URL statistics."""
         short_code = "stats123"
@@ -40,6 +73,9 @@ class TestRedisStorage:
         assert stats["original_url"] == url
         assert stats["clicks"] == 0
         assert "created_at" in stats
+        created_at = datetime.fromisoformat(stats["created_at"])
+        expires_at = datetime.fromisoformat(stats["expires_at"])
+        assert abs((expires_at - created_at).total_seconds() - ttl) <= 2
 
     async def test_increment_clicks(self, test_storage):
         """Test click counter increment."""
@@ -49,14 +85,92 @@ class TestRedisStorage:
 
         await test_storage.save_url(short_code, url, ttl)
 
-        # Simulate multiple accesses
-        await test_storage.get_url(short_code)
-        await test_storage.get_url(short_code)
-        await test_storage.get_url(short_code)
+        # Simulate multiple concurrent accesses
+        await asyncio.gather(*[test_storage.get_url(short_code) for _ in range(3)])
 
         stats = await test_storage.get_stats(short_code)
         assert stats["clicks"] == 3
 
+    async def test_get_nonexistent_url(self, test_storage):
+        """Test that looking up a missing code does not create a click counter."""
+        assert await test_storage.get_url("missing123") is None
+        assert not await test_storage.client.exists(f"{test_storage.key_prefix}clicks:missing123")
+
+    async def test_cached_clicks_batched(self, test_storage):
+        """Test that clicks on cached URLs are buffered and flushed together."""
+        short_code = "batch123"
+        url = "https://example.com"
+        ttl = 3600
+
+        await test_storage.save_url(short_code, url, ttl)
+        for _ in range(3):
+            assert await test_storage.get_url(short_code) == url
+
+        # First lookup counts in Redis, the two cache hits are buffered
+        assert test_storage._pending_clicks == {short_code: 2}
+
+        stats = await test_storage.get_stats(short_code)
+        assert stats["clicks"] == 3
+        assert not test_storage._pending_clicks
+
+    async def test_failed_click_flush_retried(self, test_storage, monkeypatch):
+        """Test that clicks kept after a failed flush are written by a later one."""
+        short_code = "retry123"
+        await test_storage.save_url(short_code, "https://example.com", 3600)
+        await test_storage.get_url(short_code)
+
+        async def fail(*args, **kwargs):
+            raise ConnectionError("Redis unavailable")
+
+        with monkeypatch.context() as patch:
+            patch.setattr(test_storage, "_evalsha", fail)
+            await test_storage.get_url(short_code)
+            await test_storage._click_flush_task
+            assert test_storage._pending_clicks == {short_code: 1}
+            assert test_storage._click_flush_failures == 1
+
+        # Retried without any further clicks or stats reads
+        await test_storage._click_flush_task
+        assert not test_storage._pending_clicks
+        assert test_storage._click_flush_failures == 0
+        assert await test_storage.client.get(f"{test_storage.key_prefix}clicks:{short_code}") == "2"
+
+    async def test_get_many(self, test_storage):
+        """Test retrieving several URLs at once."""
+        ttl = 3600
+        await test_storage.save_url("many1", "https://a.com", ttl)
+        await test_storage.save_url("many2", "https://b.com", ttl)
+        # One of them already cached
+        assert await test_storage.get_url("many1") == "https://a.com"
+
+        urls = await test_storage.get_many(["many1", "many2", "missing123"])
+        assert urls == {"many1": "https://a.com", "many2": "https://b.com"}
+
+        assert (await test_storage.get_stats("many1"))["clicks"] == 2
+        assert (await test_storage.get_stats("many2"))["clicks"] == 1
+
+    async def test_legacy_metadata_hash(self, test_storage):
+        """Test that URLs stored with the old metadata hash keep their stats."""
+        short_code = "legacy123"
+        url = "https://example.com"
+        meta_key = f"{test_storage.key_prefix}meta:{short_code}"
+        await test_storage.client.set(f"{test_storage.key_prefix}url:{short_code}", url, ex=3600)
+        await test_storage.client.hset(
+            meta_key, mapping={"created_at": "2025-11-02T16:09:22+00:00", "clicks": 4, "url": url}
+        )
+        await test_storage.client.expire(meta_key, 3600)
+
+        # Uncached lookup, then a buffered one on the cache hit
+        assert await test_storage.get_url(short_code) == url
+        assert await test_storage.get_url(short_code) == url
+
+        stats = await test_storage.get_stats(short_code)
+        assert stats["clicks"] == 6
+        assert stats["created_at"] == "2025-11-02T16:09:22+00:00"
+        assert stats["expires_at"] is not None
+        # No counter without a TTL was created
+        assert not await test_storage.client.exists(f"{test_storage.key_prefix}clicks:{short_code}")
+
     async def test_delete_url(self, test_storage):
         """Test deleting URL."""
         short_code = "delete123"
@@ -69,6 +183,74 @@ class TestRedisStorage:
         success = await test_storage.delete_url(short_code)
         assert success
         assert not await test_storage.exists(short_code)
+        # Metadata and click counter go with the mapping
+        assert not [key async for key in test_storage.client.scan_iter(f"{test_storage.key_prefix}*")]
+
+    async def test_key_prefix(self, test_storage):
+        """Test that keys are namespaced by the storage key prefix."""
+        await test_storage.save_url("prefix123", "https://example.com", 3600)
+        assert await test_storage.client.exists(f"{test_storage.key_prefix}url:prefix123")
+        assert not await test_storage.client.exists("url:prefix123")
+
+    async def test_delete_invalidates_cache(self, test_storage):
+        """Test that deleting a cached URL stops it from being served."""
+        short_code = "cached123"
+        url = "https://example.com"
+        ttl = 3600
+
+        await test_storage.save_url(short_code, url, ttl)
+        assert await test_storage.get_url(short_code) == url
+        assert short_code in test_storage.url_cache
+
+        await test_storage.delete_url(short_code)
+        assert await test_storage.get_url(short_code) is None
+
+    async def test_invalidation_from_other_worker(self, test_storage):
+        """Test that deletes published by another worker evict the local cache."""
+        short_code = "shared123"
+        listener = asyncio.create_task(test_storage.listen_for_invalidations())
+        try:
+            # Wait for the subscription before publishing
+            while not (await test_storage.client.pubsub_numsub(test_storage.invalidation_channel))[0][1]:
+                await asyncio.sleep(0.01)
+            test_storage.url_cache[short_code] = "https://example.com"
+
+            await test_storage.client.publish(test_storage.invalidation_channel, short_code)
+            for _ in range(100):
+                if short_code not in test_storage.url_cache:
+                    break
+                await asyncio.sleep(0.01)
+            assert short_code not in test_storage.url_cache
+        finally:
+            listener.cancel()
+
+    async def test_create_publishes_invalidation(self, test_storage):
+        """Test that claiming a code evicts it from other workers' caches."""
+        async with test_storage.client.pubsub() as pubsub:
+            await pubsub.subscribe(test_storage.invalidation_channel)
+            await pubsub.get_message(timeout=1)  # subscribe confirmation
+
+            assert await test_storage.save_url_if_absent("reused123", "https://example.com", 3600)
+            await test_storage.save_urls_if_absent([("reused456", "https://example.org")], 3600, 1700000000)
+
+            published = []
+            for _ in range(2):
+                message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=1)
+                published.append(message["data"])
+            assert published == ["reused123", "reused456"]
+
+    async def test_disconnect_stops_listener(self, test_storage, monkeypatch):
+        """Test that disconnecting waits for the invalidation listener to finish."""
+        # Keep the shared fake client open for the fixture's cleanup
+        monkeypatch.setattr(test_storage.client, "aclose", lambda: asyncio.sleep(0))
+        listener = asyncio.create_task(test_storage.listen_for_invalidations())
+        test_storage._invalidation_task = listener
+        while not (await test_storage.client.pubsub_numsub(test_storage.invalidation_channel))[0][1]:
+            await asyncio.sleep(0.01)
+
+        await test_storage.disconnect()
+        assert listener.cancelled()
+        assert test_storage._invalidation_task is None
 
     async def test_get_nonexistent_stats(self, test_storage):
         """Test getting stats for non-existent URL."""
@@ -79,3 +261,31 @@ class TestRedisStorage:
         """Test Redis health check."""
         healthy = await test_storage.health_check()
         assert healthy is True
+
+    async def test_rate_limit(self, test_storage):
+        """Test sliding window rate limit."""
+        allowed, remaining, _ = await test_storage.check_rate_limit("10.0.0.1", 2, 60)
+        assert allowed and remaining == 1
+
+        allowed, remaining, _ = await test_storage.check_rate_limit("10.0.0.1", 2, 60)
+        assert allowed and remaining == 0
+
+        allowed, remaining, reset = await test_storage.check_rate_limit("10.0.0.1", 2, 60)
+        assert not allowed
+        assert remaining == 0
+        assert reset > 0
+
+        # Limits are tracked per client
+        allowed, _, _ = await test_storage.check_rate_limit("10.0.0.2", 2, 60)
+        assert allowed
+
+    async def test_health_check_cached(self, test_storage, monkeypatch):
+        """Test that health checks within the cache window reuse the last PING."""
+        test_storage._last_ping = (float("-inf"), False)
+        assert await test_storage.health_check() is True
+
+        async def failing_ping():
+            raise ConnectionError("down")
+
+        monkeypatch.setattr(test_storage.client, "ping", failing_ping)
+        assert await test_storage.health_check() is True